@@ -1,38 +1,101 @@
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine,inspect,MetaData,Table,DateTime
 from sqlalchemy.dialects import (mysql,sqlite,oracle,mssql,postgresql)
 import os.path
 import json
+try:
+    import orjson
+    # orjson is strict where the standard library is not, fall back to it in those cases
+    def json_loads(content: bytes):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:# e.g. NaN/Infinity written by json.dump
+            return json.loads(content)
+    def json_dumps(obj) -> bytes:
+        try:
+            content = orjson.dumps(obj,option=orjson.OPT_SERIALIZE_NUMPY|orjson.OPT_NON_STR_KEYS)
+        except TypeError:# e.g. int beyond 64 bits
+            return json.dumps(obj).encode()
+        if b'null' in content:# orjson writes NaN/Infinity as null
+            try:
+                return json.dumps(obj).encode()
+            except TypeError:# numpy values only orjson can serialize
+                pass
+        return content
+except ImportError:# fall back to standard library
+    def json_loads(content: bytes):
+        return json.loads(content)
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+import csv
+import copy
+import importlib.util
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:# libyaml bindings not available
+    from yaml import SafeLoader, SafeDumper
 import h5py
 import logging
+import logging.handlers
 import datetime
 import pymongo
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from zipfile import ZipFile,Path
-from io import BytesIO
+from io import BytesIO,StringIO
 from tqdm import tqdm 
 from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor
 import boto3
 
 logger = logging.getLogger(__name__)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler = logging.StreamHandler()
-file_handler = logging.FileHandler('handler.log')
-console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
-logger.setLevel(logging.INFO)
 
+def configure_logging(level: int = logging.INFO,
+                      path: str = 'handler.log',
+                      capacity: int = 100):
+    """
+    Attach console and file handlers to the logger of this module, call once from the application
+
+    Parameters:
+        - level (int): logging level
+        - path (str): path to log file, None to log to console only
+        - capacity (int): number of records buffered before writing to the log file,
+          records of level ERROR and above are written immediately
+    """
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+    if path is not None:
+        file_handler = logging.FileHandler(path)
+        file_handler.setFormatter(formatter)
+        logger.addHandler(logging.handlers.MemoryHandler(capacity=capacity,
+                                                         flushLevel=logging.ERROR,
+                                                         target=file_handler))
+    logger.setLevel(level)
+
+# parsed configuration files, keyed by (parser, absolute path, mtime, size)
+_CONFIG_CACHE = {}
+# MongoDB clients shared by document stores, keyed by uri
+_MONGO_CLIENTS = {}
+
+def mongo_compressors() -> str:
+    """
+    Wire compressors for MongoClient, limited to those whose libraries are installed
+    """
+    compressors = [name for name,module in (('zstd','zstandard'),('snappy','snappy'))
+                   if importlib.util.find_spec(module) is not None]
+    compressors.append('zlib')# standard library
+    return ','.join(compressors)
 
 
 class Handler(object):
     def __init__(self,
                  config_path: str):
         self.config_path = config_path
+        self._hdf5_files = []# hdf5 files kept open for lazy datasets
         if config_path is not None:
             self.configs = self.local_load(config_path)
         else:
@@ -42,54 +105,202 @@ class Handler(object):
                     file_path: str) -> dict:
         """
         Utility function that parses hdf5 file
+
+        Datasets are loaded lazily, nothing but the attributes is read upfront:
+        contiguous, uncompressed datasets are memory-mapped (read-only),
+        other datasets are returned as h5py.Dataset, so slicing them reads
+        only the requested part from the file.
+        The file is kept open until close() is called; use materialize() to
+        read a dataset into memory
         """
         data_dict = {}
         data_dict['attrs'] = {}
         def parse_hdf5_obj(obj, parent_key=''):
             if isinstance(obj, h5py.Dataset):
-                data_dict[parent_key] = obj[()]
+                offset = obj.id.get_offset()
+                if offset is not None and obj.chunks is None and obj.compression is None \
+                        and not obj.dtype.hasobject and obj.size > 0 and len(obj.shape) > 0:
+                    data_dict[parent_key] = np.memmap(file_path,
+                                                      mode='r',
+                                                      dtype=obj.dtype,
+                                                      offset=offset,
+                                                      shape=obj.shape)
+                else:
+                    data_dict[parent_key] = obj
             elif isinstance(obj, h5py.Group):
                 for key in obj.keys():
                     parse_hdf5_obj(obj[key], parent_key + '/' + key)
 
-        with h5py.File(file_path, 'r') as file:
-            for name,value in file.attrs.items():
-                data_dict['attrs'][name]=value
-            parse_hdf5_obj(file)
+        file = h5py.File(file_path, 'r')
+        self._hdf5_files.append(file)
+        for name,value in file.attrs.items():
+            data_dict['attrs'][name]=value
+        parse_hdf5_obj(file)
 
         return data_dict
+
+    def materialize(self,
+                    key: str,
+                    data_dict: dict = None) -> np.ndarray:
+        """
+        Read the lazy hdf5 dataset at key into memory, replacing the entry in data_dict
+
+        Parameters:
+            - key (str): the key of the dataset, e.g. '/group/dataset'
+            - data_dict (dict): dictionary returned by hdf5_to_dict, defaults to self.configs
+        """
+        if data_dict is None:
+            data_dict = self.configs
+        value = data_dict[key]
+        if isinstance(value,h5py.Dataset):
+            if value.size > 0 and len(value.shape) > 0 and not value.dtype.hasobject:
+                out = np.empty(value.shape,dtype=value.dtype)
+                value.read_direct(out)# read straight into the preallocated array
+                value = out
+            else:
+                value = value[()]
+        elif isinstance(value,np.memmap):
+            value = np.array(value)
+        data_dict[key] = value
+        return value
+
+    def copy_dataset(self,
+                     src: h5py.Dataset,
+                     dst):
+        """
+        Copy hdf5 dataset src into dst (h5py.Dataset or array of the same shape)
+
+        Chunked datasets are copied one chunk at a time, so that peak memory
+        is one chunk rather than the whole dataset
+        """
+        if src.chunks is not None:
+            for selection in src.iter_chunks():
+                dst[selection] = src[selection]
+        else:
+            dst[...] = src[...]
+
+    def close(self):
+        """
+        Close the hdf5 files opened by hdf5_to_dict, invalidating their lazy datasets
+        """
+        for file in self._hdf5_files:
+            file.close()
+        self._hdf5_files = []
+
+    def yaml_to_dict(self,
+                     file_path: str) -> dict:
+        """
+        Utility function that parses yaml file
+
+        The parsed content is saved to a json sidecar file (file_path + '.json')
+        which is read instead of the yaml file on later loads, as long as the
+        sidecar is not older than the yaml file. Editing the yaml file thus
+        invalidates the sidecar automatically
+        """
+        cache_path = file_path + '.json'
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+            with open(cache_path,'rb') as file:
+                return json_loads(file.read())
+
+        with open(file_path,'r') as file:
+            data = yaml.load(file,Loader=SafeLoader)
+        try:
+            content = json_dumps(data)
+            if json_loads(content) != data:# e.g. non-string keys or datetime values
+                raise ValueError('content does not survive a json round trip')
+            with open(cache_path,'wb') as file:
+                file.write(content)
+        except (TypeError,ValueError,OSError) as e:# e.g. datetime values or read-only directory
+            logger.debug('Skip json sidecar for %s: %s',file_path,e)
+        return data
+    
+    def json_to_dict(self,
+                     file_path: str) -> dict:
+        """
+        Utility function that parses json file
+        """
+        with open(file_path,'rb') as file:
+            return json_loads(file.read())
+
+    def dict_to_json(self,
+                     file_path: str):
+        with open(file_path,'wb') as file:
+            file.write(json_dumps(self.configs))
+
+    def dict_to_yaml(self,
+                     file_path: str):
+        with open(file_path,'w') as file:
+            yaml.dump(self.configs,file,Dumper=SafeDumper)
+
+    # file extension to name of parser/writer method, to support more formats in a subclass
+    # extend a copy, e.g. _LOADERS = {**Handler._LOADERS, '.toml': 'toml_to_dict'}
+    _LOADERS = {'.json': 'json_to_dict',
+                '.yaml': 'yaml_to_dict',
+                '.yml': 'yaml_to_dict',
+                '.hd5': 'hdf5_to_dict',
+                '.h5': 'hdf5_to_dict',
+                '.hdf5': 'hdf5_to_dict'}
+    _DUMPERS = {'.json': 'dict_to_json',
+                '.yaml': 'dict_to_yaml',
+                '.yml': 'dict_to_yaml'}
+    # formats whose parsed content is cached in _CONFIG_CACHE
+    _CACHED_EXTS = ('.json','.yaml','.yml')
     
     def local_load(self,
              path: str) -> dict:
         """
         Load simple configuration file and data files from local storage
+
+        Parsed json/yaml files are cached per process and reused as long as
+        the file is not modified; a deep copy is returned on every call
         """
-        ext = os.path.splitext(path)[1]
-        if ext == '.json':
-            with open(path,'r') as file:
-                data = json.load(file)
-        elif ext == '.yaml' or ext == '.yml':
-            with open(path,'r') as file:
-                data = yaml.safe_load(file)
-        elif ext == '.hd5' or ext == '.h5' or ext == '.hdf5':
-            data = self.hdf5_to_dict(path)
-        else:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self._LOADERS:
             raise ValueError('Unsupported file format: %s' % (path))
-        
-        return data
+        loader = getattr(self,self._LOADERS[ext])
+
+        if ext in self._CACHED_EXTS:
+            stat = os.stat(path)
+            key = (loader.__func__,os.path.abspath(path),stat.st_mtime_ns,stat.st_size)
+            if key not in _CONFIG_CACHE:
+                _CONFIG_CACHE[key] = loader(path)
+            return copy.deepcopy(_CONFIG_CACHE[key])
+        return loader(path)
 
     def local_dump(self,
                    path: str):
-        ext = os.path.splitext(path)[1]
-        if ext == '.json':
-            with open(path,'w') as file:
-                json.dump(self.configs,file)
-        elif ext == '.yaml' or ext == '.yml':
-            with open(path,'w') as file:
-                yaml.dump(self.configs,file)
-        else:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self._DUMPERS:
             raise ValueError('Unsupported file format: %s' % (path))
+        getattr(self,self._DUMPERS[ext])(path)
+
+def psql_insert_copy(table,
+                     conn,
+                     keys: list[str],
+                     data_iter):
+    """
+    Insertion method for pandas.DataFrame.to_sql using PostgreSQL COPY FROM STDIN
+
+    NULL is written as \\N, since COPY would read an empty field as NULL
+    and empty strings have to be kept
+    """
+    buffer = StringIO()
+    csv.writer(buffer).writerows(['\\N' if value is None else value for value in row] for row in data_iter)
+    buffer.seek(0)
+    columns = ','.join('"%s"'%(key) for key in keys)
+    if table.schema:
+        name = '"%s"."%s"'%(table.schema,table.name)
+    else:
+        name = '"%s"'%(table.name)
+    sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')"%(name,columns)
 
+    dbapi_conn = conn.connection
+    with dbapi_conn.cursor() as cur:
+        if hasattr(cur,'copy_expert'):# psycopg2
+            cur.copy_expert(sql=sql,file=buffer)
+        else:# psycopg 3
+            with cur.copy(sql) as copy:
+                copy.write(buffer.read())
 
 
 class DatabaseHandler(Handler):
@@ -114,14 +325,26 @@ class DatabaseHandler(Handler):
             - 'database' (str): Which database to connect
         """
         Handler.__init__(self,config_path=config_path)
+        # config-derived properties, computed once
+        if self.configs is not None:
+            self._dialect = self.configs['engine']
+            self._host = self.configs.get('host','.')
+            self._database = self.configs['database']
+            self._port = self.configs.get('port')
+        else:
+            self._dialect = 'unspecified'
+            self._host = '.'
+            self._database = self.local_path
+            self._port = None
+        if self._port is not None:
+            self._db_id = '%s:%s/%s'%(self._host,self._port,self._database)
+        else:
+            self._db_id = '%s/%s'%(self._host,self._database)
+        self._conn = None# persistent connection reused by write()
+        self._dtype_cache = {}# column types for write(), keyed by table and column names
+        self._tables = {}# reflected tables for write_rows(), keyed by table name
         if csv_path is not None:
             self.engine = create_engine("sqlite:///%s"%(self.local_path))
-            if table_name is None:
-                name, _ = os.path.splitext(csv_path)
-            else:
-                name = table_name
-            self.read_csv(path=csv_path,
-                          table=name)
         else:
             if self.dialect=='unspecified':
                 self.engine = create_engine("sqlite:///%s"%(self.local_path))
@@ -136,7 +359,8 @@ class DatabaseHandler(Handler):
                                                 self.configs['password'],
                                                 self.host,
                                                 self.port,
-                                                self.database))
+                                                self.database),
+                                                pool_pre_ping=True)
                 else:
                     self.engine = create_engine("%s+%s://%s:%s@%s/%s"%
                                                 (self.configs['engine'],
@@ -144,16 +368,115 @@ class DatabaseHandler(Handler):
                                                 self.configs['user'],
                                                 self.configs['password'],
                                                 self.host,
-                                                self.database))
+                                                self.database),
+                                                pool_pre_ping=True)
             else:
                 raise ValueError('Unsupported database engine: %s'%(self.configs['engine']))
+        self._ts_type = self.timestamp_type()
+
+        if csv_path is not None:
+            if table_name is None:
+                name, _ = os.path.splitext(csv_path)
+            else:
+                name = table_name
+            self.read_csv(path=csv_path,
+                          table=name)
     
 
     @property
     def dialect(self):
-        if self.configs is None:
-            return 'unspecified'
-        return self.configs['engine']
+        return self._dialect
+
+    @property
+    def engine_dialect(self):
+        """
+        Dialect of the engine actually connected to,
+        which is sqlite when reading from csv file regardless of the configs
+        """
+        return self.engine.dialect.name
+
+    def timestamp_type(self):
+        """
+        Column type for timestamps with milliseconds in the dialect of the database
+        """
+        if self.engine_dialect == 'mysql':
+            return mysql.TIMESTAMP(fsp=3)
+        elif self.engine_dialect == 'postgresql':
+            return postgresql.TIMESTAMP(precision=3)
+        elif self.engine_dialect == 'sqlite':
+            return sqlite.DATETIME(storage_format = "%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d.%(microsecond)03d")
+        elif self.engine_dialect == 'oracle':
+            return oracle.TIMESTAMP()
+        elif self.engine_dialect == 'mssql':
+            return mssql.TIMESTAMP()
+        else:
+            return None
+
+    def _get_table(self,
+                   name: str) -> Table:
+        """
+        Reflect the table from the database once and cache it
+        """
+        if name not in self._tables:
+            table = Table(name,MetaData(),autoload_with=self.engine)
+            if self.engine_dialect == 'sqlite':# keep the millisecond storage format of write()
+                for column in table.columns:
+                    if isinstance(column.type,DateTime):
+                        column.type = self._ts_type
+            self._tables[name] = table
+        return self._tables[name]
+
+    def has_table(self,
+                  name: str) -> bool:
+        return name in self._tables or inspect(self.engine).has_table(name)
+
+    def _forget_table(self,
+                      name: str):
+        """
+        Drop everything cached about the table, call when the table is replaced
+        """
+        self._tables.pop(name,None)
+        for signature in [signature for signature in self._dtype_cache if signature[0] == name]:
+            del self._dtype_cache[signature]
+
+    @property
+    def connection(self):
+        """
+        Persistent connection to the database, opened on first use
+        """
+        if self._conn is None or self._conn.closed:
+            self._conn = self.engine.connect()
+        return self._conn
+
+    def close(self):
+        """
+        Close the persistent connection and release the connection pool
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self.engine.dispose()
+        Handler.close(self)
+
+    @property
+    def insert_method(self):
+        """
+        Insertion method passed to pandas.DataFrame.to_sql
+
+        PostgreSQL uses COPY, MySQL uses multi-row INSERT.
+        SQLite/Oracle/MSSQL keep the default executemany, since multi-row INSERT
+        quickly exceeds their limit on bound parameters per statement
+        """
+        if self.engine_dialect == 'postgresql':
+            return psql_insert_copy
+        elif self.engine_dialect == 'mysql':
+            return 'multi'
+        else:
+            return None
+
+    @property
+    def chunksize(self):
+        return 10000
 
     @property
     def local_path(self):
@@ -161,24 +484,15 @@ class DatabaseHandler(Handler):
 
     @property
     def host(self):
-        if self.configs is not None and 'host' in self.configs.keys():
-            return self.configs['host']
-        else:
-            return '.'
+        return self._host
     
     @property
     def database(self):
-        if self.configs is not None:
-            return self.configs['database']
-        else:
-            return self.local_path
+        return self._database
     
     @property
     def port(self):
-        if self.configs is not None and 'port' in self.configs.keys():
-            return self.configs['port']
-        else:
-            return None
+        return self._port
         
     
     def to_csv(self,
@@ -188,32 +502,115 @@ class DatabaseHandler(Handler):
         df = pd.read_sql_table(table_name=table,
                                con = self.engine)
         df.to_csv(path_or_buf=path,index=True,index_label=primary_key)
+
+    def iter_csv(self,
+                 path: str,
+                 chunksize: int = 100000):
+        """
+        Iterate over the csv file in path as a sequence of DataFrames of chunksize rows
+
+        Column types are inferred by pandas for each chunk separately.
+        The index keeps counting across chunks
+        """
+        with pd.read_csv(filepath_or_buffer=path,chunksize=chunksize) as reader:
+            for df in reader:
+                yield df
     
     def read_csv(self,
                  path: str,
-                 table: str):
+                 table: str,
+                 chunksize: int = 100000):
         """
         Read csv file in path into table on database, replacing the existing table
+
+        The file is streamed in chunks (see iter_csv) so that memory usage is bounded
+        by the chunk size rather than by the size of the file.
+        Column types of the table are inferred from the first chunk
+
+        Parameters:
+            - path (str): path to csv file
+            - table (str): the name of the table
+            - chunksize (int): number of rows read from the csv file at a time
         """
-        if self.port is not None:
-            logger.info('Loading csv %s into database %s:%s/%s at table %s'%(path,self.host,self.port,self.database,table))
-        else:
-            logger.info('Loading csv %s into database %s/%s at table %s'%(path,self.host,self.database,table))
+        logger.info('Loading csv %s into database %s at table %s',path,self._db_id,table)
+        self._forget_table(table)
+        chunks = self.iter_csv(path=path,
+                               chunksize=chunksize)
+        if self.engine_dialect == 'sqlite':
+            self._load_sqlite(chunks,table,path)
+            return
         
-        df = pd.read_csv(filepath_or_buffer=path)
-        df.to_sql(name=table,
-                  con=self.engine,
-                  if_exists='replace',
-                  chunksize=100)
+        if_exists = 'replace'
+        for df in chunks:
+            df.to_sql(name=table,
+                      con=self.engine,
+                      if_exists=if_exists,
+                      chunksize=self.chunksize,
+                      method=self.insert_method)
+            if_exists = 'append'
+        if if_exists == 'replace':# no rows in the csv file, create the empty table
+            pd.read_csv(filepath_or_buffer=path,nrows=0).to_sql(name=table,
+                                                                con=self.engine,
+                                                                if_exists=if_exists)
+
+    def _load_sqlite(self,
+                     chunks,
+                     table: str,
+                     path: str):
+        """
+        Bulk load DataFrames read from the csv file in path into a sqlite table,
+        replacing the existing table
+
+        Uses executemany on the raw sqlite3 connection in a single transaction,
+        with synchronous writes turned off and, unless the database is in wal mode,
+        the rollback journal kept in memory during the load
+        """
+        raw = self.engine.raw_connection()
+        cursor = raw.cursor()
+        journal_mode = None# set once changed, to be restored
+        synchronous = None
+        try:
+            # switching out of wal needs exclusive access, which other connections
+            # (e.g. the persistent one of write()) prevent; wal does without the change
+            mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            if mode.lower() != 'wal':
+                cursor.execute('PRAGMA journal_mode=MEMORY')
+                journal_mode = mode
+            synchronous = cursor.execute('PRAGMA synchronous').fetchone()[0]
+            cursor.execute('PRAGMA synchronous=OFF')
+            cursor.execute('BEGIN')
+            cursor.execute('DROP TABLE IF EXISTS "%s"'%(table.replace('"','""')))
+            insert = None
+            for df in chunks:
+                df = df.reset_index()# keep the index column written by to_sql
+                for column in df.columns:
+                    if df[column].dtype.kind == 'M':# sqlite3 has no adapter for Timestamp
+                        df[column] = [None if pd.isna(value) else value.isoformat(sep=' ') for value in df[column]]
+                if insert is None:
+                    cursor.execute(pd.io.sql.get_schema(df,table))
+                    insert = 'INSERT INTO "%s" VALUES (%s)'%(table.replace('"','""'),','.join('?'*len(df.columns)))
+                cursor.executemany(insert,df.itertuples(index=False,name=None))
+            if insert is None:# no rows in the csv file, create the empty table
+                cursor.execute(pd.io.sql.get_schema(pd.read_csv(filepath_or_buffer=path,nrows=0).reset_index(),table))
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            try:
+                if journal_mode is not None:
+                    cursor.execute('PRAGMA journal_mode=%s'%(journal_mode))
+                if synchronous is not None:
+                    cursor.execute('PRAGMA synchronous=%s'%(synchronous))
+            finally:
+                cursor.close()
+                raw.close()
 
 
     def exec_sql(self,
                  sql: str,
                  index_col: str|list[str] = None):
-        if self.port is not None:
-            logger.info('Downloading from database %s:%s/%s'%(self.host,self.port,self.database))   
-        else:
-            logger.info('Downloading from database %s/%s'%(self.host,self.database))   
+        logger.info('Downloading from database %s',self._db_id)
         with self.engine.connect() as cnx:
             data = pd.read_sql(sql=sql,
                                con=cnx,
@@ -227,36 +624,44 @@ class DatabaseHandler(Handler):
         """
         Upload data 
 
+        Reuses the persistent connection of the handler, so repeated calls
+        (e.g. from DataWriter.flush) do not reconnect to the database.
         Oracle/MSSQL timestamp to millisecond not supported
         """
-        if self.port is not None:
-            logger.info('Uploading to database %s:%s/%s'%(self.host,self.port,self.database))
-        else:
-            logger.info('Uploading to database %s/%s'%(self.host,self.database))
-        df = pd.DataFrame(data)
+        logger.info('Uploading to database %s',self._db_id)
+        signature = (table,tuple(data.keys()))
+        df = pd.DataFrame(data,copy=False)
 
-        # construct type dictionary for timestamp
-        type_dict = {}
-        for key in data.keys():
-            if isinstance(data[key][0],datetime.datetime):
-                if self.dialect == 'mysql':
-                    type_dict[key] = mysql.TIMESTAMP(fsp=3)
-                elif self.dialect == 'postgresql':
-                    type_dict[key] = postgresql.TIMESTAMP(precision=3)
-                elif self.dialect in ['unspecified','sqlite']:
-                    type_dict[key] = sqlite.DATETIME(storage_format = "%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d.%(microsecond)03d")
-                elif self.dialect == 'oracle':
-                    type_dict[key] = oracle.TIMESTAMP()
-                elif self.dialect == 'mssql':
-                    type_dict[key] = mssql.TIMESTAMP()
-
-        df.to_sql(name=table,
-                  con=self.engine,
-                  if_exists='append',
-                  index=False,
-                  chunksize=100,
-                  method=None,
-                  dtype=type_dict)
+        # type dictionary for timestamp, computed once per table and set of columns
+        type_dict = self._dtype_cache.get(signature)
+        if type_dict is None:
+            type_dict = {}
+            for key in data.keys():
+                if isinstance(next(iter(data[key])),datetime.datetime):
+                    type_dict[key] = self._ts_type
+            self._dtype_cache[signature] = type_dict
+
+        with self.connection.begin():# one transaction on the persistent connection
+            df.to_sql(name=table,
+                      con=self.connection,
+                      if_exists='append',
+                      index=False,
+                      chunksize=self.chunksize,
+                      method=self.insert_method,
+                      dtype=type_dict)
+
+    def write_rows(self,
+                   rows: list[dict],
+                   table: str):
+        """
+        Upload rows into an existing table
+
+        Executes a precompiled INSERT of the reflected table with executemany,
+        bypassing DataFrame construction and dtype inference of write()
+        """
+        logger.info('Uploading to database %s',self._db_id)
+        with self.connection.begin():
+            self.connection.execute(self._get_table(table).insert(),rows)
 
 
 class Session(object):
@@ -276,7 +681,7 @@ class Session(object):
     
     @property
     def use_local_db(self):
-        return not 'database' in self.configs.keys()
+        return 'database' not in self.configs
 
     @property
     def configs(self):
@@ -290,7 +695,8 @@ class Session(object):
         pass
 
     def close(self):
-        pass
+        for handler in self.handlers.values():
+            handler.close()
 
 class DataWriter(object):
     """
@@ -328,23 +734,62 @@ class DataWriter(object):
         Override this function to append data into the buffer
         """
         for key in data.keys():
-            if key in self._buffer.keys():# truncate data if the column name does not exist in buffer
+            if key in self._buffer:# truncate data if the column name does not exist in buffer
                 self._buffer[key].append(data[key])
 
     @property
     def _buf_size(self):
-        if len(self._buffer.keys())>0:
-            key = list(self._buffer.keys())[0]
-            return len(self._buffer[key])
-        else:
-            return 0
+        for column in self._buffer.values():
+            return len(column)
+        return 0
+
+    def _buffer_data(self) -> dict:
+        """
+        Override this function if the buffer holds more than the entries to be flushed
+        """
+        return self._buffer
+
+    def _records(self,
+                 data: dict) -> list[dict]:
+        """
+        Transpose columns of buffered data into one dictionary per entry
+        """
+        keys = list(data.keys())
+        columns = [self._python_values(column) for column in data.values()]
+        return [dict(zip(keys,values)) for values in zip(*columns)]
+
+    @staticmethod
+    def _python_values(column) -> list:
+        """
+        Convert numpy values of a buffered column to Python values accepted by database drivers
+        """
+        if isinstance(column,np.ndarray):
+            if column.dtype.kind == 'M':# datetime64[ns].tolist() gives int
+                column = column.astype('datetime64[us]')
+            return column.tolist()
+        values = []
+        for value in column:
+            if isinstance(value,np.datetime64):
+                value = value.astype('datetime64[us]')
+            if isinstance(value,np.generic):
+                value = value.item()
+            values.append(value)
+        return values
     
     def flush(self):
         """
         Flush data if the buffer is not empty
         """
         if self._buf_size > 0:
-            self._handler.write(self._buffer,self._table)# flush all data in buffer to the destination
+            data = self._buffer_data()
+            if isinstance(self._handler,DocumentStore) and type(self._handler).write is DocumentStore.write:
+                # one document per entry, uploaded in a single batch, unless write() is customized
+                self._handler.write_many(self._records(data),self._table)
+            elif isinstance(self._handler,DatabaseHandler) and type(self._handler).write is DatabaseHandler.write \
+                    and self._handler.has_table(self._table):# fast path unless write() is customized
+                self._handler.write_rows(self._records(data),self._table)
+            else:
+                self._handler.write(data,self._table)# flush all data in buffer to the destination
             self._reset_buffer()# clear buffer
 
     def write(self,
@@ -359,6 +804,59 @@ class DataWriter(object):
         if self._buf_size >= self._buf_capacity:# when the buffer is full
             self.flush()# flush all data to the destination
 
+class ArrayDataWriter(DataWriter):
+    """
+    Stream data uploading with a preallocated buffer of numpy arrays
+
+    Appending an entry stores each value at the write cursor of its column,
+    no Python list grows during streaming.
+    Every entry must provide all columns of the schema.
+    Use dtype object for columns of datetime.datetime to keep millisecond timestamps
+    """
+    def __init__(self,
+                 handler: Handler,
+                 table: str,
+                 schema: dict,
+                 capacity: int = 100):
+        """
+        Parameters:
+            - handler (Handler): the destination, e.g. DatabaseHandler or DocumentStore
+            - table (str): the name of the storage table
+            - schema (dict): column name to numpy dtype of the buffer
+            - capacity (int): number of entries buffered before flushing
+        """
+        self._schema = schema
+        self._buf_ptr = 0
+        DataWriter.__init__(self,
+                            handler=handler,
+                            table=table,
+                            capacity=capacity)
+
+    def _reset_buffer(self):
+        self._buffer = {key: np.empty(self._buf_capacity,dtype=dtype) for key,dtype in self._schema.items()}
+        self._buf_ptr = 0
+
+    def _append_buffer(self,
+                       data: dict):
+        """
+        Entries must provide every column of the schema, other keys are truncated.
+        The write cursor only advances for complete entries, so no uninitialized
+        value is ever flushed
+        """
+        ptr = self._buf_ptr
+        for key,column in self._buffer.items():
+            if key not in data:
+                raise KeyError('Entry is missing column %s of the buffer schema'%(key))
+            column[ptr] = data[key]
+        self._buf_ptr = ptr + 1
+
+    @property
+    def _buf_size(self):
+        return self._buf_ptr
+
+    def _buffer_data(self) -> dict:
+        return {key: column[:self._buf_ptr] for key,column in self._buffer.items()}
+
 class DocumentStore(Handler):
     """
     Base class for NoSQL document store handler
@@ -367,7 +865,13 @@ class DocumentStore(Handler):
                  config_path: str = None):
         Handler.__init__(self,config_path=config_path)
         if self.engine == 'mongodb':
-            client = pymongo.MongoClient("mongodb://%s:%s"%(self.host, self.port))
+            uri = "mongodb://%s:%s"%(self.host, self.port)
+            if uri not in _MONGO_CLIENTS:# one connection pool per server
+                _MONGO_CLIENTS[uri] = pymongo.MongoClient(uri,
+                                                          maxPoolSize=50,
+                                                          retryWrites=True,
+                                                          compressors=mongo_compressors())
+            client = _MONGO_CLIENTS[uri]
         self.store = client[self.database]
     
     def write(self,
@@ -376,9 +880,24 @@ class DocumentStore(Handler):
         """
         Write a document to the specified collection
         """
-        logger.info("Uploading to document store %s://%s/%s"%(self.engine,self.database,collection))
+        logger.info("Uploading to document store %s://%s/%s",self.engine,self.database,collection)
         table = self.store[collection]
         table.insert_one(document=document)
+
+    def write_many(self,
+                   documents: list[dict],
+                   collection: str):
+        """
+        Write a batch of documents to the specified collection in one request
+
+        The documents are inserted unordered, i.e., a failed document does not
+        prevent the remaining ones from being inserted
+        """
+        if len(documents) == 0:
+            return
+        logger.info("Uploading %d documents to document store %s://%s/%s",len(documents),self.engine,self.database,collection)
+        table = self.store[collection]
+        table.insert_many(documents=documents,ordered=False)
     
     
     @property
@@ -410,11 +929,35 @@ class EmailHandler(object):
                  account: str,
                  password: str):
         self.sender = account
+        self._server = None# logged-in SMTP connection reused across emails
         if 'gmail' in account:
             self.smtp_server = 'smtp.gmail.com'
             self.smtp_port = 587
             self.password = password
 
+    def _get_server(self) -> smtplib.SMTP:
+        """
+        Return the cached SMTP connection, reconnecting if the server dropped it
+        """
+        if self._server is not None:
+            try:
+                self._server.noop()
+                return self._server
+            except (smtplib.SMTPServerDisconnected,OSError):
+                self._server = None
+
+        # Create a secure connection to the SMTP server
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            server.starttls()
+            # Login to your email account
+            server.login(self.sender, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        return server
+
     def send(self,
              receiver: str,
              subject: str,
@@ -425,23 +968,26 @@ class EmailHandler(object):
         msg['Subject'] = subject
         msg.attach(MIMEText(text, 'plain'))
         try:
-            # Create a secure connection to the SMTP server
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            
-            # Login to your email account
-            server.login(self.sender, self.password)
+            server = self._get_server()
             
             # Send the email
             server.sendmail(self.sender, receiver, msg.as_string())
             logger.info('Email sent successfully!')
             
         except Exception as e:
-            logger.error('An error occurred while sending the email: %s'% e)
-            
-        finally:
-            # Close the SMTP server connection
-            server.quit()
+            logger.error('An error occurred while sending the email: %s',e)
+            self.close()# start over with a fresh connection next time
+
+    def close(self):
+        """
+        Close the SMTP server connection
+        """
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException,OSError):
+                self._server.close()
+            self._server = None
 
 
 class AwsS3Handler(object):
@@ -520,7 +1066,7 @@ class AwsS3Handler(object):
         """
         Upload file efficiently using concurrency and AWS S3 multipart upload API
         """
-        logger.info('Loading %s into AWS S3 bucket %s ...'%(path,self.bucket))
+        logger.info('Loading %s into AWS S3 bucket %s ...',path,self.bucket)
         if key is None:
             key = path
         
@@ -532,7 +1078,7 @@ class AwsS3Handler(object):
                 self.client.upload_fileobj(Fileobj=file,
                                             Bucket=self.bucket,
                                             Key=key)
-            logger.info('Complete uploading %s to AWS S3 at bucket %s'%(path,self.bucket))
+            logger.info('Complete uploading %s to AWS S3 at bucket %s',path,self.bucket)
 
     def get_file_size(self,
                       file):
@@ -0,0 +1,65 @@
+import json
+import math
+import sqlite3
+import pytest
+
+for module in ['numpy','pandas','sqlalchemy','yaml','h5py','pymongo','tqdm','boto3']:
+    pytest.importorskip(module)
+
+import numpy as np
+import handler
+
+
+@pytest.fixture
+def db(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)# local database is created in the working directory
+    database = handler.DatabaseHandler()
+    yield database
+    database.close()
+
+def query(path,sql):
+    cnx = sqlite3.connect(path)
+    try:
+        return cnx.execute(sql).fetchall()
+    finally:
+        cnx.close()
+
+
+class ListDataWriter(handler.DataWriter):
+    def _reset_buffer(self):
+        self._buffer = {'v':[]}
+
+def test_flush_numpy_scalars_stored_as_integers(db):
+    writer = ListDataWriter(handler=db,table='t',capacity=2)
+    for value in range(4):# second flush goes through write_rows
+        writer.write({'v':np.int64(value)})
+    assert query(db.local_path,'SELECT typeof(v),v FROM t') == [('integer',0),('integer',1),('integer',2),('integer',3)]
+
+
+def test_json_non_finite_and_big_int_round_trip(tmp_path):
+    path = str(tmp_path / 'configs.json')
+    config = handler.Handler(config_path=None)
+    config.configs = {'nan':float('nan'),'inf':float('inf'),'big':2**70,'none':None}
+    config.local_dump(path)
+    with open(path) as file:# same file as the standard library writes
+        assert file.read() == json.dumps(config.configs)
+    data = config.local_load(path)
+    assert math.isnan(data['nan']) and data['inf'] == float('inf')
+    assert data['big'] == 2**70 and data['none'] is None
+
+
+def test_read_csv_into_wal_database_after_write(db,tmp_path):
+    query(db.local_path,'PRAGMA journal_mode=WAL')
+    db.write({'v':[1,2]},'t')# opens the persistent connection
+    path = str(tmp_path / 'rows.csv')
+    with open(path,'w') as file:
+        file.write('a,b\n1,x\n2,y\n')
+    db.read_csv(path=path,table='c')
+    assert query(db.local_path,'SELECT a,b FROM c') == [(1,'x'),(2,'y')]
+    assert query(db.local_path,'PRAGMA journal_mode') == [('wal',)]
+
+
+def test_write_float_after_int_batch(db):
+    db.write({'v':[1,2]},'fl')
+    db.write({'v':[1.5]},'fl')
+    assert query(db.local_path,'SELECT v FROM fl') == [(1,),(2,),(1.5,)]